@@ -1,14 +1,18 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
+import numpy as np
 from datetime import datetime
 import uuid
+from collections import Counter
+from itertools import combinations
 import pytz
 import gspread
-from gspread_dataframe import get_as_dataframe, set_with_dataframe
+from gspread.utils import rowcol_to_a1
 import time # timeモジュールをインポート
-from mlxtend.frequent_patterns import apriori, association_rules # 併売分析のために追加
+import threading
+import os
+import json
+import logging
 
 # --- アプリケーションの基本設定 ---
 st.set_page_config(
@@ -51,6 +55,18 @@ MENU = {
     "【理工テ割引券】焼きそば&缶ジュースセット": 500, # 追加
 }
 
+# --- レジ画面のメニューボタン配置 ---
+# カテゴリ名: (1行あたりのボタン数, 商品リスト)
+MENU_CATEGORIES = {
+    "フード": (3, ["焼きそば", "焼きとうもろこし", "フランクフルト"]),
+    "ドリンク": (3, ["ラムネ", "缶ジュース"]),
+    "セットメニュー": (2, ["焼きそば&ラムネセット", "焼きそば&缶ジュースセット"]),
+    "割引券セット": (2, [
+        "【経シス割引券】焼きそば&缶ジュースセット", "【特別割引券】焼きそば&ラムネセット",
+        "【PiedPiper割引券】焼きそば&缶ジュースセット", "【理工テ割引券】焼きそば&缶ジュースセット",
+    ]),
+}
+
 # スプレッドシートのカラム順序を定義
 SHEET_COLUMNS = [
     "タイムスタンプ", "TransactionID", "合計金額",
@@ -60,19 +76,85 @@ SHEET_COLUMNS = [
     "【PiedPiper割引券】焼きそば&缶ジュースセット", "【理工テ割引券】焼きそば&缶ジュースセット", # 追加
     "臨時割引券" # 追加
 ]
+# 読み込む最後の列（A列からSHEET_COLUMNSの列数分）
+SHEET_LAST_COLUMN = rowcol_to_a1(1, len(SHEET_COLUMNS)).rstrip("1")
+
+# 原価計算の対象カラム（スプレッドシートの並び順）と、それに対応する原価のベクトル
+COGS_COLS = [col for col in SHEET_COLUMNS if col in COGS]
+COGS_VEC = np.array([COGS[col] for col in COGS_COLS], dtype=np.int64)
+
+# データ分析の対象とする商品（割引セットは通常セットに合算し、「臨時割引券」は除外）
+ANALYSIS_PRODUCT_COLS = [
+    "焼きそば", "焼きとうもろこし", "フランクフルト", "ラムネ", "缶ジュース",
+    "焼きそば&ラムネセット", "焼きそば&缶ジュースセット"
+]
+ANALYSIS_PRICE_VEC = np.array([MENU[col] for col in ANALYSIS_PRODUCT_COLS], dtype=np.int32)
+
+# 分析時に通常セットへ合算する割引セット
+SET_MERGE_MAP = {
+    '焼きそば&ラムネセット': ['焼きそば&ラムネセット', '【特別割引券】焼きそば&ラムネセット'],
+    '焼きそば&缶ジュースセット': [
+        '焼きそば&缶ジュースセット', '【経シス割引券】焼きそば&缶ジュースセット',
+        '【PiedPiper割引券】焼きそば&缶ジュースセット', '【理工テ割引券】焼きそば&缶ジュースセット',
+    ],
+}
+
+# 効果測定の対象とするセットメニュー・割引券
+SET_MENU_COLS = [
+    '焼きそば&ラムネセット', '焼きそば&缶ジュースセット',
+    '【経シス割引券】焼きそば&缶ジュースセット', '【特別割引券】焼きそば&ラムネセット',
+    '【PiedPiper割引券】焼きそば&缶ジュースセット', '【理工テ割引券】焼きそば&缶ジュースセット',
+    '臨時割引券'
+]
+# SET_MENU_COLSのうち、'割引券'または'臨時'を含むもの（割引利用としてカウントする）
+SET_MENU_IS_DISCOUNT = np.array([('割引券' in col) or ('臨時' in col) for col in SET_MENU_COLS])
 
 # 日本時間のタイムゾーン
 JST = pytz.timezone('Asia/Tokyo')
+# 会計時に記録するタイムスタンプの形式
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# 売上データをまとめて書き込む条件（件数または経過秒数）
+FLUSH_ROWS = 10
+FLUSH_SECONDS = 30
+
+# 詳しい分析（グラフ・併売分析）を表示するのに必要な取引件数
+MIN_ANALYSIS_TRANSACTIONS = 11
+
+# 売上データの読み込みキャッシュの有効期間（秒）
+SALES_CACHE_TTL = 60
+
+# 読み込み済みの売上データの保存先（アプリを再起動しても差分だけを読み込めるように）
+# 他のユーザーから書き換えられないよう、アプリ専用のフォルダにコードを実行しない形式で保存する
+SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".snapshot")
+SNAPSHOT_DATA_PATH = os.path.join(SNAPSHOT_DIR, "sales.parquet")
+SNAPSHOT_META_PATH = os.path.join(SNAPSHOT_DIR, "sales.json")
+# 保存は売上データ全体を書き直すため、一定時間（秒）ごとにまとめて行う
+SNAPSHOT_SAVE_INTERVAL = 300
+
+logger = logging.getLogger(__name__)
 
 # --- セッションステートの初期化 ---
-if 'cart' not in st.session_state:
-    st.session_state.cart = []
+if 'cart_counts' not in st.session_state:
+    st.session_state.cart_counts = Counter() # 商品名ごとの数量
 if 'total_amount' not in st.session_state:
     st.session_state.total_amount = 0
 if 'page' not in st.session_state:
     st.session_state.page = "register"
 if 'temp_menu' not in st.session_state:
     st.session_state.temp_menu = {}
+if 'cart_version' not in st.session_state:
+    st.session_state.cart_version = 0 # カートが変更されるたびに増やす
+if 'cart_table_cache' not in st.session_state:
+    st.session_state.cart_table_cache = (None, "") # (カートのバージョン, 整形済みの表)
+if 'combined_menu' not in st.session_state:
+    st.session_state.combined_menu = dict(MENU) # 通常メニュー＋臨時メニューの価格
+if 'pending_rows' not in st.session_state:
+    st.session_state.pending_rows = [] # スプレッドシートへ未送信の売上データ
+if 'last_flush' not in st.session_state:
+    st.session_state.last_flush = time.time()
+if 'flush_error' not in st.session_state:
+    st.session_state.flush_error = None # 直近の書き込みに失敗したときのエラーメッセージ
 
 # --- Googleスプレッドシートへの接続とSecretsの検証 ---
 secrets_ok = True
@@ -107,21 +189,112 @@ def get_gsheet_client():
 # クライアントを取得
 gc = get_gsheet_client()
 
+@st.cache_resource
+def get_worksheet(_gc):
+    """「売上データ」シートのハンドルを取得する（全セッションで共有）"""
+    return _gc.open_by_key(st.secrets["google_sheet_id"]).worksheet("売上データ")
+
 # --- データ読み書き関数 ---
-@st.cache_data(ttl=60) # 60秒間キャッシュ
+@st.cache_resource
+def get_sheet_snapshot():
+    """読み込み済みの売上データ・ヘッダー・行数・最後に読み込んだ行を保持する（全セッションで共有）"""
+    snapshot = {
+        'rows': 0, 'header': None, 'last_row': None, 'df': None,
+        'saved_at': 0.0, 'lock': threading.Lock(), 'save_lock': threading.Lock(),
+    }
+    # 保存したデータがあれば、同じスプレッドシートのものに限り引き継ぐ
+    # （シートがその後クリア・編集されていれば、最初の差分読み込みで最後の行が一致せず全件を読み込み直す）
+    if not os.path.exists(SNAPSHOT_META_PATH):
+        return snapshot
+    try:
+        with open(SNAPSHOT_META_PATH, encoding='utf-8') as f:
+            saved = json.load(f)
+        df = pd.read_parquet(SNAPSHOT_DATA_PATH, dtype_backend='pyarrow')
+        if saved['sheet_id'] == st.secrets["google_sheet_id"] and saved['length'] == len(df):
+            snapshot.update(rows=saved['rows'], header=saved['header'], last_row=saved['last_row'], df=df)
+    except Exception as e:
+        logger.warning("保存済みの売上データを読み込めませんでした（全件を読み込みます）: %s", e)
+    return snapshot
+
+def save_sheet_snapshot(snapshot, saved, df):
+    """読み込み済みの売上データをファイルに保存する（バックグラウンドのスレッドで実行する）"""
+    try:
+        with snapshot['save_lock']:
+            os.makedirs(SNAPSHOT_DIR, mode=0o700, exist_ok=True)
+            # 数値と文字列が混在する列はparquetに保存できないため、文字列として保存する（分析時に数値へ変換される）
+            object_cols = df.select_dtypes(include='object').columns
+            df = df.astype({col: 'string[pyarrow]' for col in object_cols})
+            # 書き込み途中のファイルを読まないよう、一時ファイルに書いてから置き換える
+            df.to_parquet(SNAPSHOT_DATA_PATH + ".tmp", index=False)
+            os.replace(SNAPSHOT_DATA_PATH + ".tmp", SNAPSHOT_DATA_PATH)
+            with open(SNAPSHOT_META_PATH + ".tmp", 'w', encoding='utf-8') as f:
+                json.dump(saved, f, ensure_ascii=False)
+            os.replace(SNAPSHOT_META_PATH + ".tmp", SNAPSHOT_META_PATH)
+    except Exception as e:
+        logger.warning("売上データを保存できませんでした（再起動後は全件を読み込みます）: %s", e)
+
+def read_sheet_rows(worksheet, start_row):
+    """指定した行から最後の行までの値を取得する（数値は数値のまま、日時は文字列で受け取る）"""
+    return worksheet.get(
+        f"A{start_row}:{SHEET_LAST_COLUMN}",
+        value_render_option='UNFORMATTED_VALUE',
+        date_time_render_option='FORMATTED_STRING',
+    )
+
+@st.cache_data(ttl=SALES_CACHE_TTL)
 def load_data_from_sheet(_gc):
     """スプレッドシートからデータを読み込む"""
     if _gc is None:
         return pd.DataFrame(columns=SHEET_COLUMNS)
     try:
-        spreadsheet = _gc.open_by_key(st.secrets["google_sheet_id"])
-        worksheet = spreadsheet.worksheet("売上データ")
-        # カラムが足りない場合に備えて、存在するカラムのみ読み込む
-        existing_headers = worksheet.row_values(1)
-        df = get_as_dataframe(worksheet, header=0)
-        # SHEET_COLUMNSに存在するカラムのみに絞り、順序を整える
-        df = df.reindex(columns=[col for col in SHEET_COLUMNS if col in df.columns])
-        df.dropna(how='all', inplace=True) # 全てが空の行を削除
+        worksheet = get_worksheet(_gc)
+        snapshot = get_sheet_snapshot()
+        with snapshot['lock']:
+            # 2回目以降は前回最後に読み込んだ行から読み込み、その行が変わっていなければ後ろの差分だけを追加する
+            # （売上データは追記のみなので、差分が空なら新しいデータはない）
+            if snapshot['df'] is not None:
+                start_row = snapshot['rows']
+                values = read_sheet_rows(worksheet, start_row)
+                if values and values[0] == snapshot['last_row']:
+                    if len(values) == 1:
+                        return snapshot['df']
+                    rows = values[1:]
+                else:
+                    # シートがクリア・短縮・編集されていれば、全データを読み込み直す
+                    snapshot.update(rows=0, header=None, last_row=None, df=None)
+            if snapshot['df'] is None:
+                start_row = 1
+                values = read_sheet_rows(worksheet, start_row)
+                if not values:
+                    return pd.DataFrame(columns=SHEET_COLUMNS)
+                snapshot['header'], rows = values[0], values[1:]
+            # 末尾の空セルは行ごとに省かれて返ってくるため、カラムが足りない場合に備えて
+            # 各行をヘッダーと同じ長さに揃える（足りない分はNoneで埋め、ヘッダーのない分は捨てる）
+            width = len(snapshot['header'])
+            rows = [row[:width] + [None] * (width - len(row)) for row in rows]
+            df = pd.DataFrame(rows, columns=snapshot['header'])
+            # SHEET_COLUMNSに存在するカラムのみに絞り、順序を整える
+            df = df.reindex(columns=[col for col in SHEET_COLUMNS if col in df.columns])
+            df.dropna(how='all', inplace=True) # 全てが空の行を削除
+            # キャッシュに長く保持するので、メモリ効率の良いArrow形式の列に変換しておく
+            df = df.convert_dtypes(dtype_backend='pyarrow')
+            if snapshot['df'] is not None:
+                df = pd.concat([snapshot['df'], df], ignore_index=True)
+            snapshot['rows'] = start_row + len(values) - 1
+            snapshot['last_row'] = values[-1]
+            snapshot['df'] = df
+            saved = None
+            if time.time() - snapshot['saved_at'] > SNAPSHOT_SAVE_INTERVAL:
+                snapshot['saved_at'] = time.time()
+                saved = {
+                    'sheet_id': st.secrets["google_sheet_id"],
+                    'rows': snapshot['rows'], 'header': snapshot['header'],
+                    'last_row': snapshot['last_row'], 'length': len(df),
+                }
+        # 保存はロックの外・別スレッドで行い、他のセッションの読み込みを待たせない
+        # （結合したDataFrameは作り直すだけで変更しないので、そのまま渡してよい）
+        if saved is not None:
+            threading.Thread(target=save_sheet_snapshot, args=(snapshot, saved, df), daemon=True).start()
         return df
     except gspread.exceptions.SpreadsheetNotFound:
         st.error("スプレッドシートが見つかりません。Secretsの`google_sheet_id`が正しいか、サービスアカウントにシートが共有されているか確認してください。")
@@ -133,76 +306,209 @@ def load_data_from_sheet(_gc):
         st.error(f"データの読み込み中に予期せぬエラーが発生しました: {e}")
         return pd.DataFrame(columns=SHEET_COLUMNS)
 
+def flush_pending_rows():
+    """未送信の売上データをスプレッドシートへまとめて書き込む"""
+    if not st.session_state.pending_rows:
+        return True
+    try:
+        worksheet = get_worksheet(gc)
+        worksheet.append_rows(st.session_state.pending_rows, value_input_option='USER_ENTERED')
+    # エラーは再実行後もサイドバーに表示し続ける（未送信のデータは消さずに残す）
+    except gspread.exceptions.WorksheetNotFound:
+        st.session_state.flush_error = "データの書き込みに失敗しました。Googleスプレッドシートに「売上データ」という名前のシート（タブ）が存在するか確認してください。"
+    except Exception as e:
+        st.session_state.flush_error = f"予期せぬエラーでデータの書き込みに失敗しました。: {e}"
+    else:
+        st.session_state.flush_error = None
+        st.session_state.pending_rows = []
+    # 失敗したときも試した時刻を記録し、操作のたびに書き込みを繰り返さないようにする
+    st.session_state.last_flush = time.time()
+    if st.session_state.flush_error:
+        return False
+    # 売上データの読み込みキャッシュだけを破棄する（次回は追記された行だけを取得する）
+    load_data_from_sheet.clear()
+    return True
+
+def flush_due():
+    """未送信の売上データを書き込むタイミングかどうかを返す"""
+    if not st.session_state.pending_rows:
+        return False
+    elapsed = time.time() - st.session_state.last_flush
+    if st.session_state.flush_error:
+        # 書き込みに失敗した直後は、件数にかかわらず一定時間おいてから再試行する
+        return elapsed > FLUSH_SECONDS
+    return len(st.session_state.pending_rows) >= FLUSH_ROWS or elapsed > FLUSH_SECONDS
+
+def reload_sales_data():
+    """読み込み済みの売上データを破棄し、次回スプレッドシートから全件を読み込み直す"""
+    snapshot = get_sheet_snapshot()
+    with snapshot['lock']:
+        snapshot.update(rows=0, header=None, last_row=None, df=None, saved_at=0.0)
+    with snapshot['save_lock']:
+        for path in (SNAPSHOT_META_PATH, SNAPSHOT_DATA_PATH):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+    load_data_from_sheet.clear()
+
 # --- ヘルパー関数 ---
 def get_combined_menu():
     """通常メニューと臨時メニューを結合した辞書を返す"""
-    temp_prices = {k: v['price'] for k, v in st.session_state.temp_menu.items()}
-    return {**MENU, **temp_prices}
+    # 臨時メニューの追加・クリア時にだけ更新するので、呼び出しのたびに辞書を作り直さない
+    return st.session_state.combined_menu
 
 def add_to_cart(item_name):
     """カートに商品を追加し、フィードバックを表示する"""
-    st.session_state.cart.append(item_name)
-    update_total()
+    st.session_state.cart_counts[item_name] += 1
+    st.session_state.cart_version += 1
+    # カート全体を再集計せず、追加した商品の価格だけを合計金額に加算する
+    st.session_state.total_amount += get_combined_menu().get(item_name, 0)
     st.toast(f'「{item_name}」をカートに追加しました！', icon='👍')
 
-def update_total():
-    """カート内の合計金額を計算して更新する"""
-    combined_menu = get_combined_menu()
-    st.session_state.total_amount = sum(combined_menu.get(item, 0) for item in st.session_state.cart)
-
 
 def clear_cart():
     """カートを空にする"""
-    st.session_state.cart = []
+    st.session_state.cart_counts = Counter()
+    st.session_state.cart_version += 1
     st.session_state.total_amount = 0
     st.session_state.temp_menu = {} # 臨時メニューもクリア
+    st.session_state.combined_menu = dict(MENU)
     st.session_state.page = "register"
 
-def format_cart_df():
-    """カート内の商品をDataFrame形式で整形する"""
-    if not st.session_state.cart:
-        return pd.DataFrame({"商品": [], "価格": [], "数量": []})
+def format_cart_table():
+    """カート内の商品をMarkdownの表形式で整形する"""
+    # カートが変わっていなければ前回整形した表をそのまま使う
+    cached_version, cached_table = st.session_state.cart_table_cache
+    if cached_version == st.session_state.cart_version:
+        return cached_table
     
     combined_menu = get_combined_menu()
     
-    # 商品ごとの数量をカウント
-    item_counts = pd.Series(st.session_state.cart).value_counts().reset_index()
-    item_counts.columns = ['商品', '数量']
-    # 価格情報をマージ
-    item_counts['価格'] = item_counts['商品'].map(combined_menu)
-    
-    return item_counts[['商品', '価格', '数量']]
+    # 数行しかない表なので、DataFrame（Arrow変換）を使わずにMarkdownで描画する
+    lines = ["| 商品 | 価格 | 数量 |", "| :-- | --: | --: |"]
+    # 商品ごとの数量（数量の多い順）
+    for item, count in st.session_state.cart_counts.most_common():
+        lines.append(f"| {item} | {combined_menu.get(item, 0):,} | {count} |")
+    table = "\n".join(lines)
+    st.session_state.cart_table_cache = (st.session_state.cart_version, table)
+    return table
 
 
 # --- データ分析タブで使う関数 ---
+@st.cache_data(ttl=SALES_CACHE_TTL, show_spinner=False) # 読み込みデータが変わらない限り再計算しない
 def preprocess_data(df):
     """データ分析のための前処理を行う"""
     if df.empty:
         return df
     
-    df_processed = df.copy()
-    
     # データ型の変換
     # `errors='coerce'` は変換できない値を `NaT` (Not a Time) にします
-    df_processed["タイムスタンプ"] = pd.to_datetime(df_processed["タイムスタンプ"], errors='coerce')
-    # 不正な日付データを削除
-    df_processed.dropna(subset=["タイムスタンプ"], inplace=True)
+    timestamps = pd.to_datetime(df["タイムスタンプ"], errors='coerce')
+    # 不正な日付データの行は除外する
+    valid = timestamps.notna().to_numpy()
     
-    df_processed["合計金額"] = pd.to_numeric(df_processed["合計金額"], errors='coerce')
+    # 商品カラム（存在するカラムのみ）
+    product_cols = [col for col in SHEET_COLUMNS[3:] if col in df.columns]
     
-    # 時間帯データを追加
-    df_processed['時間帯'] = df_processed['タイムスタンプ'].dt.hour
+    # 元のdfはコピーせず、分析に使うカラムだけを変換して新しいDataFrameを組み立てる
+    # （TransactionIDは分析では使わないため含めない）
+    df_processed = pd.concat([
+        timestamps[valid],
+        # 金額は整数（円）なのでint32で保持する
+        pd.to_numeric(df.loc[valid, "合計金額"], errors='coerce').fillna(0).astype('int32'),
+        # 商品ごとの数量は小さな整数なのでint16で保持する
+        df.loc[valid, product_cols].apply(pd.to_numeric, errors='coerce').fillna(0).astype('int16'),
+    ], axis=1)
     
-    # 商品カラムを数値型に変換
-    for col in SHEET_COLUMNS[3:]:
-        # カラムが存在するか確認してから処理する
-        if col in df_processed.columns:
-            df_processed[col] = pd.to_numeric(df_processed[col], errors='coerce').fillna(0)
+    # 時間帯データを追加
+    df_processed['時間帯'] = df_processed['タイムスタンプ'].dt.hour.astype('int8')
         
     return df_processed
 
 
+@st.cache_data(ttl=SALES_CACHE_TTL, show_spinner=False)
+def build_analysis_data(df):
+    """割引セットを通常セットに合算した分析用データを作成する"""
+    # 合算したカラムを丸ごと置き換えるだけなので、元のデータは共有する浅いコピーで十分
+    df_analysis = df.copy(deep=False)
+    
+    # --- 割引セットを通常セットに合算 ---
+    # 存在するカラムだけをNumPy配列として行方向にまとめて合算する
+    for merged_col, cols in SET_MERGE_MAP.items():
+        cols = [col for col in cols if col in df.columns]
+        df_analysis[merged_col] = df[cols].to_numpy(dtype=np.int32).sum(axis=1)
+
+    return df_analysis
+
+
+@st.cache_data(ttl=SALES_CACHE_TTL, show_spinner=False)
+def bin_sales_by_time(df, time_interval):
+    """指定した間隔（分）ごとの販売件数と売上を集計する"""
+    if df.empty:
+        return pd.DataFrame(columns=['タイムスタンプ', '販売件数', '売上'])
+    # タイムスタンプを分単位の整数にし、間隔で切り捨てた値をキーにしてグループ化する
+    minutes = df['タイムスタンプ'].to_numpy().astype('datetime64[m]').astype(np.int64)
+    key = minutes // time_interval * time_interval
+    grouped = df['合計金額'].groupby(key).agg(['size', 'sum'])
+    # 販売のなかった時間帯も0件として表示するため、最初から最後までの全区間に揃える
+    grouped = grouped.reindex(range(key.min(), key.max() + 1, time_interval), fill_value=0)
+    return pd.DataFrame({
+        'タイムスタンプ': grouped.index.to_numpy().astype('datetime64[m]'),
+        '販売件数': grouped['size'].to_numpy(),
+        '売上': grouped['sum'].to_numpy(),
+    })
+
+
+@st.cache_data(ttl=SALES_CACHE_TTL, show_spinner=False)
+def compute_association_rules(baskets, counts):
+    """併売分析のアソシエーションルールを求める（頻繁に購入される組み合わせがなければNoneを返す）"""
+    # 同じ買い方の取引は件数で重み付けしてまとめ、商品の組み合わせごとの支持度を直接数える
+    # （分析対象の商品は7種類なので、すべての組み合わせを調べても127通りで済む）
+    total = counts.sum()
+    records = []
+    for size in range(1, len(ANALYSIS_PRODUCT_COLS) + 1):
+        found = False
+        for combo in combinations(range(len(ANALYSIS_PRODUCT_COLS)), size):
+            support = counts[baskets[:, list(combo)].all(axis=1)].sum() / total
+            if support >= 0.05:
+                records.append((support, frozenset(ANALYSIS_PRODUCT_COLS[i] for i in combo)))
+                found = True
+        if not found:
+            break # この大きさで見つからなければ、より大きい組み合わせも支持度が足りない
+    if not records:
+        return None
+    # mlxtendは読み込みに時間がかかるため、併売分析を行うときだけ読み込む
+    from mlxtend.frequent_patterns import association_rules
+    frequent_itemsets = pd.DataFrame(records, columns=['support', 'itemsets'])
+    rules = association_rules(frequent_itemsets, metric="lift", min_threshold=1)
+    # frozensetを表示用の文字列に変換する（pandasのapplyを通さずに内包表記で処理する）
+    rules['antecedents'] = [', '.join(x) for x in rules['antecedents'].to_numpy()]
+    rules['consequents'] = [', '.join(x) for x in rules['consequents'].to_numpy()]
+    return rules
+
+
 # --- UI描画 ---
+# 未送信の売上データ（サイドバー）
+@st.fragment(run_every=FLUSH_SECONDS)
+def pending_rows_panel():
+    """未送信の売上データの件数を表示し、書き込むタイミングなら書き込む（操作がなくても定期的に実行される）"""
+    if flush_due() and flush_pending_rows():
+        st.toast("未送信の売上データを書き込みました！", icon='📤')
+    st.metric("未送信件数", f"{len(st.session_state.pending_rows)} 件")
+    if st.button("手動フラッシュ", use_container_width=True, disabled=not st.session_state.pending_rows):
+        if flush_pending_rows():
+            st.toast("未送信の売上データを書き込みました！", icon='📤')
+            st.rerun()
+    if st.session_state.flush_error:
+        st.error(st.session_state.flush_error)
+        st.warning("未送信の売上データはこの画面にだけ保存されています。書き込みが完了するまでタブを閉じないでください。")
+
+if gc:
+    with st.sidebar:
+        st.header("📤 未送信の売上データ")
+        pending_rows_panel()
+
 # タブを作成
 tab1, tab2 = st.tabs(["🛒 レジ", "📊 データ分析"])
 
@@ -216,45 +522,19 @@ with tab1:
         with col1:
             st.header("メニュー")
             
-            st.subheader("フード")
-            food_cols = st.columns(3)
-            food_items = ["焼きそば", "焼きとうもろこし", "フランクフルト"]
-            for i, item in enumerate(food_items):
-                if food_cols[i].button(f"{item} (¥{MENU[item]})", use_container_width=True):
-                    add_to_cart(item)
-                    
-            st.subheader("ドリンク")
-            drink_cols = st.columns(3)
-            drink_items = ["ラムネ", "缶ジュース"]
-            for i, item in enumerate(drink_items):
-                if drink_cols[i].button(f"{item} (¥{MENU[item]})", use_container_width=True):
-                    add_to_cart(item)
-            
-            st.subheader("セットメニュー")
-            set_cols = st.columns(2)
-            set_items = ["焼きそば&ラムネセット", "焼きそば&缶ジュースセット"]
-            for i, item in enumerate(set_items):
-                if set_cols[i].button(f"{item} (¥{MENU[item]})", use_container_width=True):
-                    add_to_cart(item)
-
-            st.subheader("割引券セット")
-            discount_cols_1 = st.columns(2)
-            # --- ★修正箇所 ---
-            if discount_cols_1[0].button(f"【経シス割引券】焼きそば&缶ジュースセット (¥{MENU['【経シス割引券】焼きそば&缶ジュースセット']})", use_container_width=True):
-                add_to_cart("【経シス割引券】焼きそば&缶ジュースセット")
-            if discount_cols_1[1].button(f"【特別割引券】焼きそば&ラムネセット (¥{MENU['【特別割引券】焼きそば&ラムネセット']})", use_container_width=True):
-                add_to_cart("【特別割引券】焼きそば&ラムネセット")
-            
-            discount_cols_2 = st.columns(2)
-            if discount_cols_2[0].button(f"【PiedPiper割引券】焼きそば&缶ジュースセット (¥{MENU['【PiedPiper割引券】焼きそば&缶ジュースセット']})", use_container_width=True):
-                add_to_cart("【PiedPiper割引券】焼きそば&缶ジュースセット")
-            if discount_cols_2[1].button(f"【理工テ割引券】焼きそば&缶ジュースセット (¥{MENU['【理工テ割引券】焼きそば&缶ジュースセット']})", use_container_width=True):
-                add_to_cart("【理工テ割引券】焼きそば&缶ジュースセット")
+            # カテゴリごとにボタンを並べる（1行あたりのボタン数はカテゴリごとに指定）
+            for category, (n_cols, items) in MENU_CATEGORIES.items():
+                st.subheader(category)
+                for start in range(0, len(items), n_cols):
+                    cols = st.columns(n_cols)
+                    for col, item in zip(cols, items[start:start + n_cols]):
+                        if col.button(f"{item} (¥{MENU[item]})", use_container_width=True):
+                            add_to_cart(item)
 
             # 臨時割引券発行機能
             with st.expander("臨時割引券セットを作成"):
-                food_options = ["焼きそば", "焼きとうもろこし", "フランクフルト"]
-                drink_options = ["ラムネ", "缶ジュース"]
+                food_options = MENU_CATEGORIES["フード"][1]
+                drink_options = MENU_CATEGORIES["ドリンク"][1]
                 
                 selected_foods = st.multiselect("フードを選択", food_options)
                 selected_drinks = st.multiselect("ドリンクを選択", drink_options)
@@ -270,6 +550,7 @@ with tab1:
                     else:
                         item_name = f"臨時割引({', '.join(selected_items)}) - {custom_price}円"
                         st.session_state.temp_menu[item_name] = {'price': custom_price, 'items': selected_items}
+                        st.session_state.combined_menu[item_name] = custom_price
                         add_to_cart(item_name)
                         # ウィジェットの値をリセットするためにrerun
                         st.rerun()
@@ -277,11 +558,10 @@ with tab1:
         with col2:
             st.header("現在の注文")
             
-            if not st.session_state.cart:
+            if not st.session_state.cart_counts:
                 st.info("商品ボタンを押して注文を追加してください。")
             else:
-                cart_df = format_cart_df()
-                st.dataframe(cart_df, hide_index=True, use_container_width=True)
+                st.markdown(format_cart_table())
                 st.metric(label="お会計", value=f"¥ {st.session_state.total_amount:,}")
                 
                 btn_cols = st.columns(2)
@@ -294,8 +574,7 @@ with tab1:
 
     elif st.session_state.page == "confirm":
         st.title("お会計確認")
-        cart_df = format_cart_df()
-        st.dataframe(cart_df, hide_index=True, use_container_width=True)
+        st.markdown(format_cart_table())
         
         st.markdown(f"""
         <div style="text-align: center; background-color: #f0f2f6; padding: 20px; border-radius: 10px;">
@@ -311,40 +590,40 @@ with tab1:
         btn_cols = st.columns(2)
         if btn_cols[0].button("✅ 会計完了", type="primary", help="このボタンを押すと売上が記録されます", use_container_width=True):
             if gc:
-                now = datetime.now(JST).strftime("%Y-%m-%d %H:%M:%S")
+                now = datetime.now(JST).strftime(TIMESTAMP_FORMAT)
                 transaction_id = str(uuid.uuid4())
                 total = st.session_state.total_amount
                 
                 # 商品ごとの数量をカウント
-                initial_counts = {col: 0 for col in SHEET_COLUMNS if col not in ["タイムスタンプ", "TransactionID", "合計金額"]}
+                item_counts = st.session_state.cart_counts.copy()
                 
-                for item in st.session_state.cart:
-                    if item in st.session_state.temp_menu: # 臨時割引券の場合
-                        initial_counts["臨時割引券"] += 1
-                        # 臨時割引券を構成する単品もカウントアップ（粗利計算や併売分析のため）
-                        for component in st.session_state.temp_menu[item]['items']:
-                            if component in initial_counts:
-                                initial_counts[component] += 1
-                    elif item in initial_counts: # 通常・割引券メニューの場合
-                        initial_counts[item] += 1
+                # 臨時割引券は「臨時割引券」としてカウントし、構成する単品もカウントアップ（粗利計算や併売分析のため）
+                for item, temp in st.session_state.temp_menu.items():
+                    count = item_counts.pop(item, 0)
+                    item_counts["臨時割引券"] += count
+                    for component in temp['items']:
+                        item_counts[component] += count
                 
-                new_row_data = [now, transaction_id, total] + [initial_counts.get(col, 0) for col in SHEET_COLUMNS[3:]]
+                new_row_data = [now, transaction_id, total] + [item_counts.get(col, 0) for col in SHEET_COLUMNS[3:]]
                 
-                try:
-                    spreadsheet = gc.open_by_key(st.secrets["google_sheet_id"])
-                    worksheet = spreadsheet.worksheet("売上データ")
-                    worksheet.append_row(new_row_data, value_input_option='USER_ENTERED')
-                    
-                    st.success("売上を記録しました！ありがとうございました！")
+                # 売上データはバッファにためておき、一定件数または一定時間ごとにまとめて書き込む
+                st.session_state.pending_rows.append(new_row_data)
+                if flush_due():
+                    flush_pending_rows()
+
+                # トーストは再実行後も表示されるので、待たずにすぐ次の会計へ進む
+                if st.session_state.flush_error:
+                    # 書き込みに失敗した売上は未送信のまま残し、エラーはサイドバーに表示し続ける
+                    st.toast("売上をスプレッドシートに書き込めませんでした。サイドバーのエラーを確認してください。", icon='⚠️')
+                elif st.session_state.pending_rows:
+                    # まだバッファにあるだけなので「記録しました」とは表示しない
+                    st.toast(f"会計を受け付けました。スプレッドシートへは未送信です（{len(st.session_state.pending_rows)}件）。", icon='📤')
                     st.balloons()
-                    st.cache_data.clear()
-                    time.sleep(2)
-                    clear_cart()
-                    st.rerun()
-                except gspread.exceptions.WorksheetNotFound:
-                    st.error("データの書き込みに失敗しました。Googleスプレッドシートに「売上データ」という名前のシート（タブ）が存在するか確認してください。")
-                except Exception as e:
-                    st.error(f"予期せぬエラーでデータの書き込みに失敗しました。: {e}")
+                else:
+                    st.toast("売上を記録しました！ありがとうございました！", icon='✅')
+                    st.balloons()
+                clear_cart()
+                st.rerun()
             else:
                 st.error("Googleスプレッドシートに接続できません。設定を確認してください。")
 
@@ -356,52 +635,40 @@ with tab1:
 with tab2:
     st.title("📊 リアルタイム売上分析")
     
+    # 全タブのコードは毎回実行されるため、レジ操作のたびに分析を再計算しないようにオンのときだけ表示する
+    show_analytics = st.toggle("分析を表示する", key="show_analytics")
+    
     if not gc:
         st.error("Googleスプレッドシートに接続できていないため、分析データを表示できません。")
+    elif not show_analytics:
+        st.info("「分析を表示する」をオンにすると、最新の売上データで分析結果を表示します。")
     else:
+        # シートを直接編集した場合などに、全データを読み込み直す
+        if st.button("🔄 再読み込み", help="スプレッドシートから全データを読み込み直します"):
+            reload_sales_data()
+
         df_raw = load_data_from_sheet(gc)
+        # 未送信の売上データも分析に含める（会計した売上がすぐに反映されるように）
+        if st.session_state.pending_rows:
+            pending_df = pd.DataFrame(st.session_state.pending_rows, columns=SHEET_COLUMNS)
+            # シートから読み込んだ日時はシートの表示形式の文字列なので、未送信データは先に日時型にしておく
+            # （形式の違う文字列のまま結合すると、前処理で片方の日時が欠損扱いになり分析から漏れる）
+            pending_df['タイムスタンプ'] = pd.to_datetime(pending_df['タイムスタンプ'], format=TIMESTAMP_FORMAT)
+            df_raw = pd.concat([df_raw, pending_df], ignore_index=True)
 
         if df_raw.empty:
             st.warning("まだ売上データがありません。会計が完了すると、ここに分析結果が表示されます。")
         else:
             df = preprocess_data(df_raw)
 
-            df_analysis = df.copy()
-            
-            # --- 割引セットを通常セットに合算 ---
-            # カラムが存在するかチェックしながら安全に合算
-            yaki_lamu_cols = ['焼きそば&ラムネセット']
-            # if '【経シス割引券】焼きそば&ラムネセット' in df.columns: yaki_lamu_cols.append('【経シス割引券】焼きそば&ラムネセット') # ★修正: この行は不要
-            if '【特別割引券】焼きそば&ラムネセット' in df.columns: yaki_lamu_cols.append('【特別割引券】焼きそば&ラムネセット')
-            df_analysis['焼きそば&ラムネセット'] = df[yaki_lamu_cols].sum(axis=1)
-
-            yaki_can_cols = ['焼きそば&缶ジュースセット']
-            if '【経シス割引券】焼きそば&缶ジュースセット' in df.columns: yaki_can_cols.append('【経シス割引券】焼きそば&缶ジュースセット') # ★修正: 経シス割引券はこちらに
-            if '【PiedPiper割引券】焼きそば&缶ジュースセット' in df.columns: yaki_can_cols.append('【PiedPiper割引券】焼きそば&缶ジュースセット')
-            if '【理工テ割引券】焼きそば&缶ジュースセット' in df.columns: yaki_can_cols.append('【理工テ割引券】焼きそば&缶ジュースセット')
-            df_analysis['焼きそば&缶ジュースセット'] = df[yaki_can_cols].sum(axis=1)
-
-            # --- 修正箇所：分析対象から「臨時割引券」を除外 ---
-            product_cols_for_analysis = [
-                "焼きそば", "焼きとうもろこし", "フランクフルト", "ラムネ", "缶ジュース",
-                "焼きそば&ラムネセット", "焼きそば&缶ジュースセット"
-            ]
-
             # 1. サマリー
             st.header("📈 サマリー")
             total_sales = df['合計金額'].sum()
             
             # --- 粗利計算 ---
-            product_cols_in_cogs = [col for col in df.columns if col in COGS]
-            total_cogs = 0
-            if not df.empty:
-                for col in product_cols_in_cogs:
-                    total_cogs += (df[col] * COGS[col]).sum()
-                
-                # 臨時割引券の原価も計算
-                if '臨時割引券' in df.columns and df['臨時割引券'].sum() > 0:
-                    # 会計完了時に単品もカウントしているため、粗利は自動的に計算される
-                    pass
+            # 数量の行列と原価のベクトルの積で、総原価を一度に計算する（存在しないカラムは0）
+            # （臨時割引券は会計完了時に構成する単品もカウントしているため、その原価もここに含まれる）
+            total_cogs = int(df.reindex(columns=COGS_COLS, fill_value=0).to_numpy(dtype=np.int64).dot(COGS_VEC).sum())
 
             gross_profit = total_sales - total_cogs
             
@@ -414,108 +681,108 @@ with tab2:
             with summary_cols[2]: st.metric("総販売件数", f"{total_transactions} 件")
             with summary_cols[3]: st.metric("平均客単価", f"¥ {avg_sales_per_customer:,.0f}")
 
-            st.divider()
-
-            # 2. 商品別分析
-            st.header("🍔 商品別分析")
-            # --- 修正箇所：臨時割引券を除外した分析ロジックに修正 ---
-            if not df_analysis.empty and all(col in df_analysis.columns for col in product_cols_for_analysis):
-                quantities = df_analysis[product_cols_for_analysis].sum()
-                
-                prices_for_analysis = {k: v for k, v in MENU.items() if k in quantities.index}
-                prices = pd.Series(prices_for_analysis)[quantities.index]
-                
-                sales_by_product = quantities * prices
-                product_sales = pd.DataFrame({'販売数量': quantities,'売上金額': sales_by_product}).reset_index().rename(columns={'index': '商品'})
+            # 取引が少ないうちはグラフや併売分析を省き、サマリーだけを表示する
+            if total_transactions < MIN_ANALYSIS_TRANSACTIONS:
+                st.info(f"データが少ないため簡易表示しています。詳しい分析には、あと {MIN_ANALYSIS_TRANSACTIONS - total_transactions} 件以上の取引データが必要です。")
             else:
-                product_sales = pd.DataFrame(columns=['商品', '販売数量', '売上金額'])
-
-            col_rank1, col_rank2 = st.columns(2)
-            with col_rank1:
-                st.subheader("💰 売上金額ランキング")
-                top_sales = product_sales.sort_values('売上金額', ascending=False).reset_index(drop=True)
-                st.dataframe(top_sales.style.background_gradient(subset=['売上金額'], cmap='Reds'), hide_index=True, use_container_width=True)
-            with col_rank2:
-                st.subheader("🔢 販売数量ランキング")
-                top_quantity = product_sales.sort_values('販売数量', ascending=False).reset_index(drop=True)
-                st.dataframe(top_quantity.style.background_gradient(subset=['販売数量'], cmap='Blues'), hide_index=True, use_container_width=True)
-
-            st.subheader("🍰 売上構成比")
-            sorted_product_sales = product_sales.sort_values('売上金額', ascending=False)
-            fig_pie = px.pie(sorted_product_sales[sorted_product_sales['売上金額']>0], names='商品', values='売上金額', title='商品別の売上構成比', hole=0.3)
-            fig_pie.update_traces(textposition='inside', textinfo='percent+label', sort=False)
-            st.plotly_chart(fig_pie, use_container_width=True)
-
-            st.divider()
-
-            # 3. 時間帯別分析
-            st.header("🕒 時間帯別分析")
-            time_interval = st.radio("集計間隔を選択（分）", [10, 20, 30, 60], horizontal=True, index=3)
-            df_time_analysis = df.set_index('タイムスタンプ')
-            # resampleの引数を修正
-            time_binned = df_time_analysis.resample(f'{time_interval}min').agg(販売件数=('TransactionID', 'count'), 売上=('合計金額', 'sum')).reset_index()
-            fig_hist = px.bar(time_binned, x='タイムスタンプ', y='販売件数', title=f'{time_interval}分間の販売件数推移', hover_data=['売上'])
-            fig_hist.update_xaxes(title_text='時間')
-            fig_hist.update_yaxes(title_text='販売件数')
-            st.plotly_chart(fig_hist, use_container_width=True)
+                # グラフ描画ライブラリはレジでは使わないため、詳しい分析を表示するときだけ読み込む
+                import plotly.express as px
+                import plotly.graph_objects as go
+
+                df_analysis = build_analysis_data(df)
+                # 分析対象の商品カラムを一度だけNumPy配列にし、商品別分析と併売分析の両方で使う
+                product_matrix = df_analysis.reindex(columns=ANALYSIS_PRODUCT_COLS, fill_value=0).to_numpy(dtype=np.int16)
+
+                st.divider()
+
+                # 2. 商品別分析
+                st.header("🍔 商品別分析")
+                # --- 修正箇所：臨時割引券を除外した分析ロジックに修正 ---
+                if not df_analysis.empty:
+                    # 数量の集計と価格の掛け算をNumPy配列で一度に行う
+                    quantities = product_matrix.sum(axis=0)
+                    sales_by_product = quantities * ANALYSIS_PRICE_VEC
+                    product_sales = pd.DataFrame({'商品': ANALYSIS_PRODUCT_COLS, '販売数量': quantities, '売上金額': sales_by_product})
+                else:
+                    product_sales = pd.DataFrame(columns=['商品', '販売数量', '売上金額'])
+
+                # 売上金額順・販売数量順の並びを求める（売上金額順は構成比のグラフでも使う）
+                top_sales = product_sales.iloc[np.argsort(-product_sales['売上金額'].to_numpy(), kind='stable')]
+                top_quantity = product_sales.iloc[np.argsort(-product_sales['販売数量'].to_numpy(), kind='stable')]
+
+                col_rank1, col_rank2 = st.columns(2)
+                with col_rank1:
+                    st.subheader("💰 売上金額ランキング")
+                    st.dataframe(top_sales.style.background_gradient(subset=['売上金額'], cmap='Reds'), hide_index=True, use_container_width=True)
+                with col_rank2:
+                    st.subheader("🔢 販売数量ランキング")
+                    st.dataframe(top_quantity.style.background_gradient(subset=['販売数量'], cmap='Blues'), hide_index=True, use_container_width=True)
+
+                st.subheader("🍰 売上構成比")
+                pie_data = top_sales[top_sales['売上金額']>0]
+                fig_pie = go.Figure(go.Pie(labels=pie_data['商品'].to_numpy(), values=pie_data['売上金額'].to_numpy(), hole=0.3, sort=False))
+                fig_pie.update_traces(textposition='inside', textinfo='percent+label')
+                fig_pie.update_layout(title='商品別の売上構成比')
+                st.plotly_chart(fig_pie, use_container_width=True)
+
+                st.divider()
+
+                # 3. 時間帯別分析
+                st.header("🕒 時間帯別分析")
+                time_interval = st.radio("集計間隔を選択（分）", [10, 20, 30, 60], horizontal=True, index=3)
+                time_binned = bin_sales_by_time(df, time_interval)
+                fig_hist = px.bar(time_binned, x='タイムスタンプ', y='販売件数', title=f'{time_interval}分間の販売件数推移', hover_data=['売上'])
+                fig_hist.update_xaxes(title_text='時間')
+                fig_hist.update_yaxes(title_text='販売件数')
+                st.plotly_chart(fig_hist, use_container_width=True)
             
-            st.divider()
-
-            # 4. 併売分析 (アソシエーション分析)
-            st.header("🤝 併売分析 (アソシエーションルール)")
-            st.info("""
-            **支持度 (Support):** 全体の中で、商品AとBが同時に買われる確率。
-            **信頼度 (Confidence):** 商品Aを買った人が、商品Bも買う確率。
-            **リフト値 (Lift):** 商品B単体で売れる確率に比べ、Aを買ったことでBが売れる確率が何倍になったか。**1より大きいと正の相関**があり、値が大きいほど関連性が強いとされます。
-            """)
+                st.divider()
+
+                # 4. 併売分析 (アソシエーション分析)
+                st.header("🤝 併売分析 (アソシエーションルール)")
+                st.info("""
+                **支持度 (Support):** 全体の中で、商品AとBが同時に買われる確率。
+                **信頼度 (Confidence):** 商品Aを買った人が、商品Bも買う確率。
+                **リフト値 (Lift):** 商品B単体で売れる確率に比べ、Aを買ったことでBが売れる確率が何倍になったか。**1より大きいと正の相関**があり、値が大きいほど関連性が強いとされます。
+                """)
             
-            # --- 修正箇所：臨時割引券を除外したデータで分析 ---
-            basket_sets = df_analysis[product_cols_for_analysis] > 0
+                # --- 修正箇所：臨時割引券を除外したデータで分析 ---
+                # 同じ買い方の取引をまとめ、買い方ごとの件数を求める
+                baskets, basket_counts = np.unique(product_matrix > 0, axis=0, return_counts=True)
             
-            if len(basket_sets) > 10:
-                frequent_itemsets = apriori(basket_sets, min_support=0.05, use_colnames=True)
-                if not frequent_itemsets.empty:
-                    rules = association_rules(frequent_itemsets, metric="lift", min_threshold=1)
+                rules = compute_association_rules(baskets, basket_counts)
+                if rules is not None:
                     if not rules.empty:
-                        rules['antecedents'] = rules['antecedents'].apply(lambda x: ', '.join(list(x)))
-                        rules['consequents'] = rules['consequents'].apply(lambda x: ', '.join(list(x)))
                         st.subheader("📈 リフト値TOP10の組み合わせ")
                         display_rules = rules.sort_values('lift', ascending=False).head(10)
                         st.dataframe(display_rules[['antecedents', 'consequents', 'support', 'confidence', 'lift']], hide_index=True, use_container_width=True)
                     else: st.warning("リフト値が1を超える意味のある組み合わせは見つかりませんでした。")
                 else: st.warning("頻繁に購入される商品の組み合わせが見つかりませんでした。")
-            else: st.warning("分析するには、あと " + str(11 - len(basket_sets)) + " 件以上の取引データが必要です。")
 
-            st.divider()
+                st.divider()
 
-            # 5 & 6. セットメニューと割引券の効果測定 (元のdfを使用)
-            st.header("🎁 セットメニュー・割引券の効果測定")
+                # 5 & 6. セットメニューと割引券の効果測定 (元のdfを使用)
+                st.header("🎁 セットメニュー・割引券の効果測定")
             
-            # dfにカラムが存在するか確認
-            set_menu_cols = [
-                '焼きそば&ラムネセット', '焼きそば&缶ジュースセット',
-                '【経シス割引券】焼きそば&缶ジュースセット', '【特別割引券】焼きそば&ラムネセット', # ★修正
-                '【PiedPiper割引券】焼きそば&缶ジュースセット', '【理工テ割引券】焼きそば&缶ジュースセット',
-                '臨時割引券' # 臨時割引券を追加
-            ]
-            set_menu_data = {
-                'メニュー': set_menu_cols,
-                '販売数': [df[name].sum() if name in df.columns else 0 for name in set_menu_cols]
-            }
-            set_menu_df = pd.DataFrame(set_menu_data)
-
-            # 割引券の利用率
-            total_sets_and_tickets = set_menu_df['販売数'].sum()
-            # '割引券'または'臨時'を含むメニューを割引利用としてカウント
-            discount_sets = set_menu_df[set_menu_df['メニュー'].str.contains('割引券|臨時', na=False)]['販売数'].sum()
-            discount_rate = (discount_sets / total_sets_and_tickets * 100) if total_sets_and_tickets > 0 else 0
+                # dfに存在しないカラムは0として、まとめて集計する
+                set_menu_data = {
+                    'メニュー': SET_MENU_COLS,
+                    '販売数': df.reindex(columns=SET_MENU_COLS, fill_value=0).sum().to_numpy()
+                }
+                set_menu_df = pd.DataFrame(set_menu_data)
+
+                # 割引券の利用率
+                total_sets_and_tickets = set_menu_df['販売数'].sum()
+                # '割引券'または'臨時'を含むメニューを割引利用としてカウント
+                discount_sets = set_menu_df['販売数'].to_numpy()[SET_MENU_IS_DISCOUNT].sum()
+                discount_rate = (discount_sets / total_sets_and_tickets * 100) if total_sets_and_tickets > 0 else 0
             
-            set_cols = st.columns(2)
-            with set_cols[0]:
-                st.subheader("セットメニュー・割引券販売数")
-                st.dataframe(set_menu_df, hide_index=True, use_container_width=True)
-            with set_cols[1]:
-                st.subheader("割引券利用状況")
-                st.metric("全セット+割引券販売数", f"{total_sets_and_tickets:.0f} 個")
-                st.metric("うち割引券(臨時含む)利用数", f"{discount_sets:.0f} 個")
-                st.metric("割引券利用率", f"{discount_rate:.1f} %")
+                set_cols = st.columns(2)
+                with set_cols[0]:
+                    st.subheader("セットメニュー・割引券販売数")
+                    st.dataframe(set_menu_df, hide_index=True, use_container_width=True)
+                with set_cols[1]:
+                    st.subheader("割引券利用状況")
+                    st.metric("全セット+割引券販売数", f"{total_sets_and_tickets:.0f} 個")
+                    st.metric("うち割引券(臨時含む)利用数", f"{discount_sets:.0f} 個")
+                    st.metric("割引券利用率", f"{discount_rate:.1f} %")